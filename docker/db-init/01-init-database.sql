@@ -156,11 +156,11 @@ CREATE TABLE test_trend_data (
 
 -- Insert default test users
 INSERT INTO test_users (username, email, password_hash, salt, is_active, biometric_enabled, two_factor_enabled, user_role) VALUES
-('valid_user', 'valid@example.com', '$2b$12$LQv3c1yqBWVHxkd0LHAkCOYz6TtxMQJqhN8/LewdBPj92N/YVYK4i', 'randomsalt123', true, false, false, 'user'),
-('admin_user', 'admin@example.com', '$2b$12$LQv3c1yqBWVHxkd0LHAkCOYz6TtxMQJqhN8/LewdBPj92N/YVYK4i', 'randomsalt456', true, true, true, 'admin'),
-('locked_user', 'locked@example.com', '$2b$12$LQv3c1yqBWVHxkd0LHAkCOYz6TtxMQJqhN8/LewdBPj92N/YVYK4i', 'randomsalt789', true, false, false, 'user'),
-('biometric_user', 'biometric@example.com', '$2b$12$LQv3c1yqBWVHxkd0LHAkCOYz6TtxMQJqhN8/LewdBPj92N/YVYK4i', 'randomsalt101', true, true, false, 'user'),
-('inactive_user', 'inactive@example.com', '$2b$12$LQv3c1yqBWVHxkd0LHAkCOYz6TtxMQJqhN8/LewdBPj92N/YVYK4i', 'randomsalt102', false, false, false, 'user');
+('valid_user', 'valid@example.com', '$argon2id$v=19$m=65536,t=2,p=1$CaRWCjXB2HtktwUiL3zIiQ$OTMvXGH+3shrfX6iApt90EW1ws1MukInXVj/UuI0bRE', 'randomsalt123', true, false, false, 'user'),
+('admin_user', 'admin@example.com', '$argon2id$v=19$m=65536,t=2,p=1$4+oKcbjd6Pt37IHJnybBjg$QnC1KAdQYuhTQxKZjRkL6d4sK/S7nmKuehAw9bcrWDs', 'randomsalt456', true, true, true, 'admin'),
+('locked_user', 'locked@example.com', '$argon2id$v=19$m=65536,t=2,p=1$qsKMt9yGPqVwf0BO7RbRRg$5Lc9GW60vifDQIrNWgooaoZyf0vOOJP4etwzJDFcxRk', 'randomsalt789', true, false, false, 'user'),
+('biometric_user', 'biometric@example.com', '$argon2id$v=19$m=65536,t=2,p=1$+b0ofuh7cr3aYotXqRgHsw$DlLlV2fhfHHcFsuXk98Uc+FgKzXooxatWOqCRqOwakc', 'randomsalt101', true, true, false, 'user'),
+('inactive_user', 'inactive@example.com', '$argon2id$v=19$m=65536,t=2,p=1$s3Q/PALUuSiACnQxGaQ/Rw$ct8K4t7wLgX+AaCG9e/L4u/fwgY3SRXtKIoqqbB2SZ8', 'randomsalt102', false, false, false, 'user');
 
 -- Set the locked user as locked
 UPDATE test_users SET is_locked = true, failed_login_attempts = 5 WHERE username = 'locked_user';
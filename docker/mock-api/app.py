@@ -4,25 +4,43 @@ Mock API Server for Mobile Authentication Testing
 Simulates a real mobile authentication backend with comprehensive security features
 """
 
+# Cooperative I/O: must run before anything else imports socket/threading
+from gevent import monkey
+monkey.patch_all()
+
+import psycogreen.gevent
+psycogreen.gevent.patch_psycopg()
+
 import os
 import json
+import atexit
 import time
-import uuid
+import queue
+import threading
+import weakref
 import hashlib
+import hmac
 import secrets
 import base64
+import ipaddress
 from datetime import datetime, timedelta
+from functools import lru_cache
 from typing import Dict, List, Optional, Any
 import logging
 
-from flask import Flask, request, jsonify, session
-from flask_cors import CORS
+from flask import Flask, request, session, g
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
+from gevent.threadpool import ThreadPool
+from gevent.pywsgi import WSGIServer
 import psycopg2
+from psycopg2.extras import Json, execute_values
+from psycopg2.pool import ThreadedConnectionPool
 import redis
 import jwt
-from werkzeug.security import generate_password_hash, check_password_hash
+import orjson
+from argon2 import PasswordHasher
+from argon2.exceptions import VerificationError, InvalidHashError
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -30,7 +48,37 @@ logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'mobile-auth-secret-key-for-testing')
-CORS(app)
+
+# CORS: comma-separated origins, '*' allows any
+CORS_ALLOWED_ORIGINS = frozenset(
+    origin.strip() for origin in os.environ.get('CORS_ALLOWED_ORIGINS', '*').split(',') if origin.strip()
+)
+CORS_ALLOW_ANY_ORIGIN = '*' in CORS_ALLOWED_ORIGINS
+CORS_ALLOW_METHODS = 'GET, POST, OPTIONS'
+
+@app.before_request
+def cors_preflight():
+    """Answer CORS preflight requests without dispatching to a route"""
+    # Unknown paths fall through so routing still answers 404
+    if request.method == 'OPTIONS' and request.url_rule is not None:
+        response = app.response_class(status=204)
+        response.headers['Access-Control-Allow-Methods'] = CORS_ALLOW_METHODS
+        request_headers = request.headers.get('Access-Control-Request-Headers')
+        if request_headers:
+            response.headers['Access-Control-Allow-Headers'] = request_headers
+        return response
+
+@app.after_request
+def cors_headers(response):
+    """Add Access-Control-Allow-Origin for allowed origins"""
+    if CORS_ALLOW_ANY_ORIGIN:
+        response.headers['Access-Control-Allow-Origin'] = '*'
+    else:
+        origin = request.headers.get('Origin')
+        if origin in CORS_ALLOWED_ORIGINS:
+            response.headers['Access-Control-Allow-Origin'] = origin
+        response.vary.add('Origin')
+    return response
 
 # Rate limiting
 limiter = Limiter(
@@ -40,14 +88,76 @@ limiter = Limiter(
 )
 
 # Database and Redis connections
+# Per worker process: 4 gunicorn workers x 20 stays under Postgres' default max_connections=100.
+# psycopg2 only keeps minconn idle connections and closes the rest on putconn, so minconn
+# defaults to maxconn to keep connections (and their prepared statements) warm.
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', 20))
+DB_POOL_MIN = int(os.environ.get('DB_POOL_MIN', DB_POOL_MAX))
+
+db_pool = ThreadedConnectionPool(
+    minconn=DB_POOL_MIN,
+    maxconn=DB_POOL_MAX,
+    host=os.environ.get('DB_HOST', 'postgres-db'),
+    database=os.environ.get('DB_NAME', 'mobile_auth_testing'),
+    user=os.environ.get('DB_USER', 'test_user'),
+    password=os.environ.get('DB_PASS', 'test_password'),
+    port=5432
+)
+atexit.register(db_pool.closeall)
+
+# ThreadedConnectionPool raises when exhausted; with many greenlets in flight, wait for a slot instead
+db_pool_slots = threading.BoundedSemaphore(DB_POOL_MAX)
+
+def checkout_connection():
+    """Take a connection from the pool, waiting while all of them are in use"""
+    db_pool_slots.acquire()
+    try:
+        return db_pool.getconn()
+    except Exception:
+        db_pool_slots.release()
+        raise
+
+def checkin_connection(conn):
+    """Give a connection back to the pool"""
+    try:
+        db_pool.putconn(conn)
+    finally:
+        db_pool_slots.release()
+
 def get_db_connection():
-    return psycopg2.connect(
-        host=os.environ.get('DB_HOST', 'postgres-db'),
-        database=os.environ.get('DB_NAME', 'mobile_auth_testing'),
-        user=os.environ.get('DB_USER', 'test_user'),
-        password=os.environ.get('DB_PASS', 'test_password'),
-        port=5432
-    )
+    """Borrow a pooled connection for the current request"""
+    if 'db' not in g:
+        g.db = checkout_connection()
+    return g.db
+
+# Hot statements are prepared once per pooled connection and EXECUTEd afterwards
+LOGIN_LOOKUP_SQL = """
+    SELECT id, username, email, password_hash, salt, is_active, is_locked, 
+           failed_login_attempts, biometric_enabled, two_factor_enabled, user_role
+    FROM test_users WHERE {column} = $1
+"""
+
+PREPARED_STATEMENTS = {
+    'login_lookup_by_username': LOGIN_LOOKUP_SQL.format(column='username'),
+    'login_lookup_by_email': LOGIN_LOOKUP_SQL.format(column='email'),
+}
+prepared_statements = weakref.WeakKeyDictionary()
+
+def execute_prepared(cursor, name: str, params: tuple):
+    """Execute a named statement, preparing it on first use on this connection"""
+    prepared = prepared_statements.setdefault(cursor.connection, set())
+    if name not in prepared:
+        cursor.execute(f"PREPARE {name} AS {PREPARED_STATEMENTS[name]}")
+        prepared.add(name)
+    placeholders = ', '.join(['%s'] * len(params))
+    cursor.execute(f"EXECUTE {name} ({placeholders})", params)
+
+@app.teardown_appcontext
+def release_db_connection(exception=None):
+    """Return the request's connection to the pool (open transactions are rolled back)"""
+    conn = g.pop('db', None)
+    if conn is not None:
+        checkin_connection(conn)
 
 def get_redis_connection():
     return redis.Redis(
@@ -58,39 +168,99 @@ def get_redis_connection():
 
 redis_client = get_redis_connection()
 
+# Atomic fixed-window counter: INCR, set the TTL on the first hit, compare against the limit.
+# One key per identifier on purpose: Redis runs commands serially on a single thread, so
+# striping the counter across keys would add reads without removing any contention.
+rate_limit_script = redis_client.register_script("""
+local current = redis.call('INCR', KEYS[1])
+if current == 1 then
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+if current > tonumber(ARGV[1]) then
+    return 0
+end
+return 1
+""")
+
 # JWT Configuration
 JWT_SECRET = os.environ.get('JWT_SECRET', 'jwt-secret-for-testing')
+JWT_KEY = JWT_SECRET.encode('utf-8')  # HMAC key bytes, encoded once
 JWT_ALGORITHM = 'HS256'
+JWT_ALGORITHMS = [JWT_ALGORITHM]
 JWT_EXPIRATION_HOURS = 24
+JWT_TTL = timedelta(hours=JWT_EXPIRATION_HOURS)
+JWT_DECODE_CACHE_SIZE = 4096
+
+# Password hashing (argon2id is the only stored format, see docker/db-init)
+password_hasher = PasswordHasher(time_cost=2, memory_cost=65536, parallelism=1)
+# Each argon2 call allocates memory_cost KiB (64 MiB), so cap concurrent KDFs per worker
+PASSWORD_HASH_THREADS = int(os.environ.get('PASSWORD_HASH_THREADS', 1))
+password_hash_pool = ThreadPool(PASSWORD_HASH_THREADS)
+
+def run_in_threadpool(func, *args):
+    """Run a blocking KDF on the password hashing threads"""
+    return password_hash_pool.apply(func, args)
+
+# Verified against when the user doesn't exist so both branches cost the same
+DUMMY_PASSWORD_HASH = password_hasher.hash(secrets.token_urlsafe(16))
 
 # Security Configuration
 MAX_LOGIN_ATTEMPTS = 5
 ACCOUNT_LOCKOUT_DURATION = 30  # minutes
 CAPTCHA_THRESHOLD = 3
+CAPTCHA_RANDOM_BUFFER_SIZE = 256  # bytes of os.urandom fetched per refill
 SESSION_TIMEOUT = 30  # minutes
 
+# Auth event logging
+AUTH_EVENT_QUEUE_SIZE = 10000
+AUTH_EVENT_BATCH_SIZE = 100
+
+# Captcha digits aren't secrets; share one urandom buffer instead of a syscall per digit.
+# (A threading.local buffer would be per-greenlet under gevent, i.e. refilled every request.)
+captcha_random_lock = threading.Lock()
+captcha_random_bytes = bytearray()
+
+def random_captcha_digit() -> int:
+    """Uniform random digit 0-9 drawn from the shared buffer"""
+    with captcha_random_lock:
+        while True:
+            if not captcha_random_bytes:
+                captcha_random_bytes.extend(os.urandom(CAPTCHA_RANDOM_BUFFER_SIZE))
+            byte = captcha_random_bytes.pop()
+            if byte < 250:  # reject 250-255 so byte % 10 stays unbiased
+                return byte % 10
+
 class AuthenticationService:
     """Handles authentication logic and security features"""
     
     @staticmethod
     def generate_jwt_token(user_data: Dict) -> str:
         """Generate JWT token for authenticated user"""
+        now = datetime.utcnow()
         payload = {
             'user_id': str(user_data['id']),
             'username': user_data['username'],
             'email': user_data['email'],
             'role': user_data.get('user_role', 'user'),
-            'exp': datetime.utcnow() + timedelta(hours=JWT_EXPIRATION_HOURS),
-            'iat': datetime.utcnow(),
-            'jti': str(uuid.uuid4())  # JWT ID for token revocation
+            'exp': now + JWT_TTL,
+            'iat': now,
+            'jti': secrets.token_urlsafe(16)  # JWT ID for token revocation
         }
-        return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
+        return jwt.encode(payload, JWT_KEY, algorithm=JWT_ALGORITHM)
+    
+    @staticmethod
+    @lru_cache(maxsize=JWT_DECODE_CACHE_SIZE)
+    def decode_jwt_token(token: str) -> Dict:
+        """Verify JWT signature once per token; expiry is checked by the caller on every use"""
+        return jwt.decode(token, JWT_KEY, algorithms=JWT_ALGORITHMS, options={"verify_exp": False})
     
     @staticmethod
     def verify_jwt_token(token: str) -> Optional[Dict]:
         """Verify and decode JWT token"""
         try:
-            payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+            payload = AuthenticationService.decode_jwt_token(token)
+            if payload['exp'] <= time.time():
+                raise jwt.ExpiredSignatureError("Signature has expired")
             
             # Check if token is blacklisted
             if redis_client.get(f"blacklist:{payload['jti']}"):
@@ -105,35 +275,62 @@ class AuthenticationService:
             return None
     
     @staticmethod
-    def blacklist_token(token: str):
-        """Add token to blacklist"""
+    def blacklist_token(token: str, pipe=None):
+        """Add token to blacklist (queued on ``pipe`` when one is given)"""
         try:
-            payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM], options={"verify_exp": False})
-            redis_client.setex(f"blacklist:{payload['jti']}", 86400, "blacklisted")  # 24 hours
+            payload = AuthenticationService.decode_jwt_token(token)
+            (pipe or redis_client).setex(f"blacklist:{payload['jti']}", 86400, "blacklisted")  # 24 hours
         except Exception as e:
             logger.error(f"Error blacklisting token: {e}")
     
+    @staticmethod
+    def verify_password(password_hash: str, password: str) -> bool:
+        """Check password against its argon2 hash, off the event loop"""
+        return run_in_threadpool(AuthenticationService.match_password_hash, password_hash, password)
+    
+    @staticmethod
+    def match_password_hash(password_hash: str, password: str) -> bool:
+        """Blocking hash comparison behind verify_password"""
+        try:
+            return password_hasher.verify(password_hash, password)
+        except (VerificationError, InvalidHashError):
+            return False
+    
+    @staticmethod
+    def hash_password(password: str) -> str:
+        """Hash password with the current argon2 parameters, off the event loop"""
+        return run_in_threadpool(password_hasher.hash, password)
+    
+    @staticmethod
+    def password_needs_rehash(password_hash: str) -> bool:
+        """Whether a verified hash uses outdated argon2 parameters"""
+        return password_hasher.check_needs_rehash(password_hash)
+    
     @staticmethod
     def check_rate_limit(identifier: str, limit: int, window: int) -> bool:
         """Check if rate limit is exceeded"""
         key = f"rate_limit:{identifier}"
-        current = redis_client.get(key)
+        return bool(rate_limit_script(keys=[key], args=[limit, window]))
+    
+    @staticmethod
+    def create_session(session_data: Dict[str, Any]) -> str:
+        """Store session fields as a Redis hash and return the new session id"""
+        session_id = secrets.token_urlsafe(16)
+        key = f"session:{session_id}"
         
-        if current is None:
-            redis_client.setex(key, window, 1)
-            return True
-        elif int(current) < limit:
-            redis_client.incr(key)
-            return True
-        else:
-            return False
+        pipe = redis_client.pipeline()
+        pipe.hset(key, mapping=session_data)
+        pipe.expire(key, SESSION_TIMEOUT * 60)
+        pipe.execute()
+        
+        return session_id
     
     @staticmethod
     def generate_captcha() -> Dict[str, str]:
         """Generate simple captcha for testing"""
-        num1 = secrets.randbelow(10)
-        num2 = secrets.randbelow(10)
-        captcha_id = str(uuid.uuid4())
+        num1 = random_captcha_digit()
+        num2 = random_captcha_digit()
+        captcha_id = secrets.token_urlsafe(16)
         answer = str(num1 + num2)
         
         # Store captcha answer in Redis with 5-minute expiration
@@ -149,7 +346,8 @@ class AuthenticationService:
     def verify_captcha(captcha_id: str, user_answer: str) -> bool:
         """Verify captcha answer"""
         correct_answer = redis_client.get(f"captcha:{captcha_id}")
-        if correct_answer and str(user_answer).strip() == correct_answer:
+        if correct_answer and hmac.compare_digest(str(user_answer).strip().encode('utf-8'),
+                                                  correct_answer.encode('utf-8')):
             redis_client.delete(f"captcha:{captcha_id}")  # One-time use
             return True
         return False
@@ -157,49 +355,136 @@ class AuthenticationService:
 auth_service = AuthenticationService()
 
 # Helper functions
+def json_response(payload: Dict[str, Any], status: int = 200):
+    """Serialize payload with orjson into a JSON response"""
+    return app.response_class(orjson.dumps(payload), status=status, mimetype='application/json')
+
 def get_client_info() -> Dict[str, Any]:
-    """Extract client information from request"""
-    return {
-        'ip_address': request.environ.get('HTTP_X_FORWARDED_FOR', request.remote_addr),
-        'user_agent': request.headers.get('User-Agent', ''),
-        'timestamp': datetime.utcnow().isoformat(),
-        'device_id': request.headers.get('X-Device-ID'),
-        'app_version': request.headers.get('X-App-Version'),
-        'platform': request.headers.get('X-Platform'),
-        'device_fingerprint': request.headers.get('X-Device-Fingerprint')
-    }
-
-def log_auth_event(user_id: str, event_type: str, success: bool, additional_data: Dict = None):
-    """Log authentication event to database"""
+    """Extract client information from request (computed once per request)"""
+    if 'client_info' not in g:
+        g.client_info = {
+            'ip_address': request.environ.get('HTTP_X_FORWARDED_FOR', request.remote_addr),
+            'user_agent': request.headers.get('User-Agent', ''),
+            'device_id': request.headers.get('X-Device-ID'),
+            'app_version': request.headers.get('X-App-Version'),
+            'platform': request.headers.get('X-Platform'),
+            'device_fingerprint': request.headers.get('X-Device-Fingerprint')
+        }
+    return g.client_info
+
+AUTH_EVENT_INSERT = """
+    INSERT INTO auth_events_log (user_id, event_type, ip_address, user_agent, 
+                               device_fingerprint, additional_data, risk_score, timestamp)
+    VALUES %s
+"""
+
+auth_event_queue = queue.Queue(maxsize=AUTH_EVENT_QUEUE_SIZE)
+
+def log_auth_event(user_id: Optional[str], event_type: str, success: bool, additional_data: Dict = None,
+                   identifier: str = None):
+    """Queue authentication event for the background writer (user_id is a test_users id or None)"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        client_info = get_client_info()
+        # Unknown users are logged with user_id=None and the submitted username/email as identifier
+        if identifier is not None:
+            additional_data = {**(additional_data or {}), 'identifier': identifier}
         
-        cursor.execute("""
-            INSERT INTO auth_events_log (user_id, event_type, ip_address, user_agent, 
-                                       device_fingerprint, additional_data, risk_score)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-        """, (
-            user_id, event_type, client_info['ip_address'], client_info['user_agent'],
+        client_info = get_client_info()
+        ip = get_client_ip(client_info)
+        auth_event_queue.put_nowait((
+            user_id, event_type, str(ip) if ip is not None else None, client_info['user_agent'],
             client_info.get('device_fingerprint'), 
-            json.dumps(additional_data or {}), 
-            calculate_risk_score(client_info, success)
+            Json(additional_data or {}), 
+            calculate_risk_score(client_info, success),
+            datetime.utcnow()  # event time; the column default would be the batch's insert time
         ))
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
+    except queue.Full:
+        logger.warning(f"Auth event queue full, dropping {event_type} event")
     except Exception as e:
         logger.error(f"Error logging auth event: {e}")
 
+def write_auth_events(rows: List[tuple]):
+    """Insert a batch of auth events using a dedicated pooled connection"""
+    conn = checkout_connection()
+    try:
+        try:
+            with conn.cursor() as cursor:
+                execute_values(cursor, AUTH_EVENT_INSERT, rows)
+            conn.commit()
+        except psycopg2.Error:
+            conn.rollback()
+            # Retry row by row so one bad event doesn't drop the whole batch
+            for row in rows:
+                try:
+                    with conn.cursor() as cursor:
+                        execute_values(cursor, AUTH_EVENT_INSERT, [row])
+                    conn.commit()
+                except psycopg2.Error as e:
+                    conn.rollback()
+                    logger.error(f"Error logging auth event: {e}")
+    finally:
+        checkin_connection(conn)
+
+def drain_auth_events(block: bool) -> List[tuple]:
+    """Take up to AUTH_EVENT_BATCH_SIZE queued events"""
+    rows = []
+    try:
+        if block:
+            rows.append(auth_event_queue.get())
+        while len(rows) < AUTH_EVENT_BATCH_SIZE:
+            rows.append(auth_event_queue.get_nowait())
+    except queue.Empty:
+        pass
+    return rows
+
+def auth_event_writer():
+    """Background loop that batches queued auth events into the database"""
+    while True:
+        rows = drain_auth_events(block=True)
+        try:
+            write_auth_events(rows)
+        except Exception as e:
+            logger.error(f"Error writing auth events: {e}")
+
+def flush_auth_events():
+    """Write whatever is still queued (called at shutdown)"""
+    while True:
+        rows = drain_auth_events(block=False)
+        if not rows:
+            break
+        try:
+            write_auth_events(rows)
+        except Exception as e:
+            logger.error(f"Error flushing auth events: {e}")
+            break
+
+threading.Thread(target=auth_event_writer, name='auth-event-writer', daemon=True).start()
+atexit.register(flush_auth_events)
+
+@lru_cache(maxsize=8192)
+def parse_ip(ip: str):
+    """ip as an ipaddress object, or None if it isn't an address (cached per address)"""
+    try:
+        return ipaddress.ip_address(ip.split('%')[0])  # drop IPv6 zone ids, which INET rejects
+    except ValueError:
+        return None
+
+def get_client_ip(client_info: Dict):
+    """Parsed first X-Forwarded-For hop (the client), or None if missing or invalid"""
+    return parse_ip((client_info.get('ip_address') or '').split(',')[0].strip())
+
+def get_request_hour() -> int:
+    """Local hour of the current request (computed once per request)"""
+    if 'request_hour' not in g:
+        g.request_hour = datetime.now().hour
+    return g.request_hour
+
 def calculate_risk_score(client_info: Dict, success: bool) -> int:
     """Calculate risk score based on various factors"""
     risk_score = 0
     
     # IP-based risk
-    ip = client_info.get('ip_address', '')
-    if ip.startswith('127.') or ip.startswith('192.168.'):
+    ip = get_client_ip(client_info)
+    if ip is not None and ip.is_private:
         risk_score += 10  # Local IP
     
     # Device fingerprinting
@@ -211,7 +496,7 @@ def calculate_risk_score(client_info: Dict, success: bool) -> int:
         risk_score += 30
     
     # Time-based risk (unusual hours)
-    hour = datetime.now().hour
+    hour = get_request_hour()
     if hour < 6 or hour > 22:
         risk_score += 15
     
@@ -225,26 +510,24 @@ def health_check():
     try:
         # Check database connection
         conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT 1")
-        cursor.close()
-        conn.close()
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1")
         
         # Check Redis connection
         redis_client.ping()
         
-        return jsonify({
+        return json_response({
             'status': 'healthy',
             'timestamp': datetime.utcnow().isoformat(),
             'version': '1.0.0'
-        }), 200
+        }, 200)
     except Exception as e:
         logger.error(f"Health check failed: {e}")
-        return jsonify({
+        return json_response({
             'status': 'unhealthy',
             'error': str(e),
             'timestamp': datetime.utcnow().isoformat()
-        }), 503
+        }, 503)
 
 @app.route('/api/auth/login', methods=['POST'])
 @limiter.limit("10 per minute")
@@ -253,11 +536,11 @@ def login():
     try:
         data = request.get_json()
         if not data or not data.get('username') or not data.get('password'):
-            return jsonify({
+            return json_response({
                 'success': False,
                 'message': 'Username and password are required',
                 'error_code': 'MISSING_CREDENTIALS'
-            }), 400
+            }, 400)
         
         username = data['username'].strip().lower()
         password = data['password']
@@ -269,33 +552,33 @@ def login():
         
         # Check rate limiting
         if not auth_service.check_rate_limit(client_id, 10, 300):  # 10 attempts per 5 minutes
-            log_auth_event(username, 'login_rate_limited', False, client_info)
-            return jsonify({
+            log_auth_event(None, 'login_rate_limited', False, client_info, identifier=username)
+            return json_response({
                 'success': False,
                 'message': 'Too many login attempts. Please try again later.',
                 'error_code': 'RATE_LIMITED'
-            }), 429
+            }, 429)
         
         # Get user from database
         conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT id, username, email, password_hash, salt, is_active, is_locked, 
-                   failed_login_attempts, biometric_enabled, two_factor_enabled, user_role
-            FROM test_users WHERE username = %s OR email = %s
-        """, (username, username))
-        
-        user = cursor.fetchone()
+        with conn.cursor() as cursor:
+            # One indexed column per lookup instead of an OR across username and email
+            if '@' in username:
+                execute_prepared(cursor, 'login_lookup_by_email', (username,))
+            else:
+                execute_prepared(cursor, 'login_lookup_by_username', (username,))
+            
+            user = cursor.fetchone()
         
         if not user:
-            # Simulate timing attack protection
-            time.sleep(0.1)
-            log_auth_event(username, 'login_failed_user_not_found', False, client_info)
-            return jsonify({
+            # Timing attack protection: spend the same work as a real password check
+            auth_service.verify_password(DUMMY_PASSWORD_HASH, password)
+            log_auth_event(None, 'login_failed_user_not_found', False, client_info, identifier=username)
+            return json_response({
                 'success': False,
                 'message': 'Invalid credentials',
                 'error_code': 'INVALID_CREDENTIALS'
-            }), 401
+            }, 401)
         
         user_data = {
             'id': user[0], 'username': user[1], 'email': user[2], 
@@ -307,93 +590,96 @@ def login():
         # Check if user is active
         if not user_data['is_active']:
             log_auth_event(str(user_data['id']), 'login_failed_inactive', False, client_info)
-            return jsonify({
+            return json_response({
                 'success': False,
                 'message': 'Account is inactive',
                 'error_code': 'ACCOUNT_INACTIVE'
-            }), 401
+            }, 401)
         
         # Check if user is locked
         if user_data['is_locked']:
             log_auth_event(str(user_data['id']), 'login_failed_locked', False, client_info)
-            return jsonify({
+            return json_response({
                 'success': False,
                 'message': 'Account is temporarily locked due to too many failed attempts',
                 'error_code': 'ACCOUNT_LOCKED',
                 'unlock_time': (datetime.utcnow() + timedelta(minutes=ACCOUNT_LOCKOUT_DURATION)).isoformat()
-            }), 401
+            }, 401)
         
         # Check if CAPTCHA is required
         failed_attempts = user_data['failed_login_attempts']
         if failed_attempts >= CAPTCHA_THRESHOLD:
             if not captcha_id or not captcha_answer:
                 captcha = auth_service.generate_captcha()
-                return jsonify({
+                return json_response({
                     'success': False,
                     'message': 'CAPTCHA verification required',
                     'error_code': 'CAPTCHA_REQUIRED',
                     'captcha': captcha
-                }), 400
+                }, 400)
             
             if not auth_service.verify_captcha(captcha_id, captcha_answer):
                 log_auth_event(str(user_data['id']), 'login_failed_captcha', False, client_info)
                 captcha = auth_service.generate_captcha()
-                return jsonify({
+                return json_response({
                     'success': False,
                     'message': 'Invalid CAPTCHA',
                     'error_code': 'INVALID_CAPTCHA',
                     'captcha': captcha
-                }), 400
+                }, 400)
         
         # Verify password
-        if not check_password_hash(user_data['password_hash'], password):
-            # Update failed login attempts
-            cursor.execute("""
-                UPDATE test_users SET failed_login_attempts = failed_login_attempts + 1,
-                       last_login_attempt = CURRENT_TIMESTAMP,
-                       is_locked = CASE WHEN failed_login_attempts + 1 >= %s THEN true ELSE false END
-                WHERE id = %s
-            """, (MAX_LOGIN_ATTEMPTS, user_data['id']))
+        if not auth_service.verify_password(user_data['password_hash'], password):
+            # Update failed login attempts and read back the resulting lock state
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    UPDATE test_users SET failed_login_attempts = failed_login_attempts + 1,
+                           last_login_attempt = CURRENT_TIMESTAMP,
+                           is_locked = (failed_login_attempts + 1 >= %s)
+                    WHERE id = %s
+                    RETURNING failed_login_attempts, is_locked
+                """, (MAX_LOGIN_ATTEMPTS, user_data['id']))
+                failed_attempts, is_locked = cursor.fetchone()
             conn.commit()
             
             log_auth_event(str(user_data['id']), 'login_failed_password', False, client_info)
             
             # Check if account should be locked
-            if failed_attempts + 1 >= MAX_LOGIN_ATTEMPTS:
-                return jsonify({
+            if is_locked:
+                return json_response({
                     'success': False,
                     'message': 'Account locked due to too many failed attempts',
                     'error_code': 'ACCOUNT_LOCKED'
-                }), 401
+                }, 401)
             
-            return jsonify({
+            return json_response({
                 'success': False,
                 'message': 'Invalid credentials',
                 'error_code': 'INVALID_CREDENTIALS',
-                'remaining_attempts': MAX_LOGIN_ATTEMPTS - (failed_attempts + 1)
-            }), 401
-        
-        # Successful authentication - reset failed attempts
-        cursor.execute("""
-            UPDATE test_users SET failed_login_attempts = 0, last_login_attempt = CURRENT_TIMESTAMP,
-                   is_locked = false WHERE id = %s
-        """, (user_data['id'],))
+                'remaining_attempts': MAX_LOGIN_ATTEMPTS - failed_attempts
+            }, 401)
+        
+        # Successful authentication - reset failed attempts and upgrade outdated password hashes
+        password_hash = user_data['password_hash']
+        if auth_service.password_needs_rehash(password_hash):
+            password_hash = auth_service.hash_password(password)
+        
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                UPDATE test_users SET failed_login_attempts = 0, last_login_attempt = CURRENT_TIMESTAMP,
+                       is_locked = false, password_hash = %s WHERE id = %s
+            """, (password_hash, user_data['id']))
         conn.commit()
-        cursor.close()
-        conn.close()
         
         # Generate JWT token
         token = auth_service.generate_jwt_token(user_data)
         
         # Store session info in Redis
-        session_id = str(uuid.uuid4())
-        session_data = {
+        session_id = auth_service.create_session({
             'user_id': str(user_data['id']),
             'username': user_data['username'],
-            'login_time': datetime.utcnow().isoformat(),
-            'client_info': client_info
-        }
-        redis_client.setex(f"session:{session_id}", SESSION_TIMEOUT * 60, json.dumps(session_data))
+            'login_time': int(time.time())
+        })
         
         log_auth_event(str(user_data['id']), 'login_success', True, client_info)
         
@@ -418,15 +704,15 @@ def login():
             response_data['requires_2fa'] = True
             response_data['message'] = 'Two-factor authentication required'
         
-        return jsonify(response_data), 200
+        return json_response(response_data, 200)
         
     except Exception as e:
         logger.error(f"Login error: {e}")
-        return jsonify({
+        return json_response({
             'success': False,
             'message': 'Internal server error',
             'error_code': 'INTERNAL_ERROR'
-        }), 500
+        }, 500)
 
 @app.route('/api/auth/biometric', methods=['POST'])
 @limiter.limit("5 per minute")
@@ -439,36 +725,36 @@ def biometric_auth():
         biometric_data = data.get('biometric_data')  # Base64 encoded biometric template
         
         if not all([username, biometric_type, biometric_data]):
-            return jsonify({
+            return json_response({
                 'success': False,
                 'message': 'Username, biometric type, and biometric data are required',
                 'error_code': 'MISSING_BIOMETRIC_DATA'
-            }), 400
+            }, 400)
         
         client_info = get_client_info()
         
         # Get user and biometric data from database
         conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT u.id, u.username, u.email, u.is_active, u.is_locked, u.user_role,
-                   b.template_data, b.is_enrolled
-            FROM test_users u
-            LEFT JOIN biometric_test_data b ON u.id = b.user_id 
-                AND b.biometric_type = %s AND b.is_active = true
-            WHERE u.username = %s OR u.email = %s
-        """, (biometric_type, username, username))
-        
-        result = cursor.fetchone()
+        lookup_column = 'email' if '@' in username else 'username'
+        with conn.cursor() as cursor:
+            cursor.execute(f"""
+                SELECT u.id, u.username, u.email, u.is_active, u.is_locked, u.user_role,
+                       b.template_data, b.is_enrolled
+                FROM test_users u
+                LEFT JOIN biometric_test_data b ON u.id = b.user_id 
+                    AND b.biometric_type = %s AND b.is_active = true
+                WHERE u.{lookup_column} = %s
+            """, (biometric_type, username))
+            
+            result = cursor.fetchone()
         
         if not result or not result[0]:
-            log_auth_event(username, 'biometric_failed_user_not_found', False, client_info)
-            return jsonify({
+            log_auth_event(None, 'biometric_failed_user_not_found', False, client_info, identifier=username)
+            return json_response({
                 'success': False,
                 'message': 'User not found or biometric not enrolled',
                 'error_code': 'BIOMETRIC_NOT_ENROLLED'
-            }), 401
+            }, 401)
         
         user_data = {
             'id': result[0], 'username': result[1], 'email': result[2],
@@ -478,60 +764,58 @@ def biometric_auth():
         
         # Check user status
         if not user_data['is_active']:
-            return jsonify({
+            return json_response({
                 'success': False,
                 'message': 'Account is inactive',
                 'error_code': 'ACCOUNT_INACTIVE'
-            }), 401
+            }, 401)
         
         if user_data['is_locked']:
-            return jsonify({
+            return json_response({
                 'success': False,
                 'message': 'Account is locked',
                 'error_code': 'ACCOUNT_LOCKED'
-            }), 401
+            }, 401)
         
         if not user_data['is_enrolled'] or not user_data['template_data']:
-            return jsonify({
+            return json_response({
                 'success': False,
                 'message': 'Biometric authentication not enrolled for this user',
                 'error_code': 'BIOMETRIC_NOT_ENROLLED'
-            }), 401
+            }, 401)
         
         # Simulate biometric matching (in real implementation, this would be complex biometric comparison)
         # For testing purposes, we'll simulate successful match if provided data matches stored template
-        stored_template = base64.b64encode(user_data['template_data']).decode('utf-8')
+        try:
+            provided_template = base64.b64decode(biometric_data, validate=True)
+        except (TypeError, ValueError):
+            provided_template = b''
         
-        # Simple comparison for testing - in production, use proper biometric matching algorithms
-        if biometric_data == stored_template:
+        # Simple constant-time comparison for testing - in production, use proper biometric matching algorithms
+        if hmac.compare_digest(provided_template, bytes(user_data['template_data'])):
             # Update last used timestamp
-            cursor.execute("""
-                UPDATE biometric_test_data SET last_used = CURRENT_TIMESTAMP 
-                WHERE user_id = %s AND biometric_type = %s
-            """, (user_data['id'], biometric_type))
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    UPDATE biometric_test_data SET last_used = CURRENT_TIMESTAMP 
+                    WHERE user_id = %s AND biometric_type = %s
+                """, (user_data['id'], biometric_type))
             conn.commit()
             
             # Generate JWT token
             token = auth_service.generate_jwt_token(user_data)
             
             # Create session
-            session_id = str(uuid.uuid4())
-            session_data = {
+            session_id = auth_service.create_session({
                 'user_id': str(user_data['id']),
                 'username': user_data['username'],
                 'auth_method': 'biometric',
                 'biometric_type': biometric_type,
-                'login_time': datetime.utcnow().isoformat(),
-                'client_info': client_info
-            }
-            redis_client.setex(f"session:{session_id}", SESSION_TIMEOUT * 60, json.dumps(session_data))
+                'login_time': int(time.time())
+            })
             
             log_auth_event(str(user_data['id']), f'biometric_success_{biometric_type}', True, client_info)
             
-            cursor.close()
-            conn.close()
-            
-            return jsonify({
+            return json_response({
                 'success': True,
                 'message': 'Biometric authentication successful',
                 'token': token,
@@ -545,25 +829,23 @@ def biometric_auth():
                 'auth_method': 'biometric',
                 'biometric_type': biometric_type,
                 'expires_in': JWT_EXPIRATION_HOURS * 3600
-            }), 200
+            }, 200)
         else:
             log_auth_event(str(user_data['id']), f'biometric_failed_{biometric_type}', False, client_info)
-            cursor.close()
-            conn.close()
             
-            return jsonify({
+            return json_response({
                 'success': False,
                 'message': 'Biometric verification failed',
                 'error_code': 'BIOMETRIC_MISMATCH'
-            }), 401
+            }, 401)
         
     except Exception as e:
         logger.error(f"Biometric auth error: {e}")
-        return jsonify({
+        return json_response({
             'success': False,
             'message': 'Internal server error',
             'error_code': 'INTERNAL_ERROR'
-        }), 500
+        }, 500)
 
 @app.route('/api/auth/logout', methods=['POST'])
 def logout():
@@ -571,45 +853,46 @@ def logout():
     try:
         auth_header = request.headers.get('Authorization')
         if not auth_header or not auth_header.startswith('Bearer '):
-            return jsonify({
+            return json_response({
                 'success': False,
                 'message': 'Authorization token required',
                 'error_code': 'MISSING_TOKEN'
-            }), 401
+            }, 401)
         
         token = auth_header.split(' ')[1]
         payload = auth_service.verify_jwt_token(token)
         
         if not payload:
-            return jsonify({
+            return json_response({
                 'success': False,
                 'message': 'Invalid or expired token',
                 'error_code': 'INVALID_TOKEN'
-            }), 401
+            }, 401)
         
-        # Blacklist the token
-        auth_service.blacklist_token(token)
+        # Blacklist the token and remove session data in one round-trip
+        pipe = redis_client.pipeline(transaction=False)
+        auth_service.blacklist_token(token, pipe)
         
-        # Remove session data
         session_id = request.json.get('session_id') if request.json else None
         if session_id:
-            redis_client.delete(f"session:{session_id}")
+            pipe.delete(f"session:{session_id}")
+        pipe.execute()
         
         # Log logout event
         log_auth_event(payload['user_id'], 'logout', True, get_client_info())
         
-        return jsonify({
+        return json_response({
             'success': True,
             'message': 'Logout successful'
-        }), 200
+        }, 200)
         
     except Exception as e:
         logger.error(f"Logout error: {e}")
-        return jsonify({
+        return json_response({
             'success': False,
             'message': 'Internal server error',
             'error_code': 'INTERNAL_ERROR'
-        }), 500
+        }, 500)
 
 @app.route('/api/auth/password-reset', methods=['POST'])
 @limiter.limit("3 per minute")
@@ -620,19 +903,19 @@ def password_reset():
         email = data.get('email', '').strip().lower()
         
         if not email:
-            return jsonify({
+            return json_response({
                 'success': False,
                 'message': 'Email address is required',
                 'error_code': 'MISSING_EMAIL'
-            }), 400
+            }, 400)
         
         client_info = get_client_info()
         
         # Check if user exists (don't reveal if user exists or not for security)
         conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, username, email FROM test_users WHERE email = %s", (email,))
-        user = cursor.fetchone()
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT id, username, email FROM test_users WHERE email = %s", (email,))
+            user = cursor.fetchone()
         
         # Always return success to prevent email enumeration
         # In real implementation, only send email if user exists
@@ -659,22 +942,19 @@ def password_reset():
             # In real implementation, send email here
             logger.info(f"Password reset requested for user {username}. Reset token: {reset_token}")
         
-        cursor.close()
-        conn.close()
-        
-        return jsonify({
+        return json_response({
             'success': True,
             'message': 'If the email address exists in our system, a password reset link has been sent.',
             'reset_token': reset_token if user else None  # Only for testing purposes
-        }), 200
+        }, 200)
         
     except Exception as e:
         logger.error(f"Password reset error: {e}")
-        return jsonify({
+        return json_response({
             'success': False,
             'message': 'Internal server error',
             'error_code': 'INTERNAL_ERROR'
-        }), 500
+        }, 500)
 
 @app.route('/api/auth/verify-token', methods=['POST'])
 def verify_token():
@@ -682,16 +962,16 @@ def verify_token():
     try:
         auth_header = request.headers.get('Authorization')
         if not auth_header or not auth_header.startswith('Bearer '):
-            return jsonify({
+            return json_response({
                 'valid': False,
                 'message': 'Authorization token required'
-            }), 401
+            }, 401)
         
         token = auth_header.split(' ')[1]
         payload = auth_service.verify_jwt_token(token)
         
         if payload:
-            return jsonify({
+            return json_response({
                 'valid': True,
                 'user': {
                     'id': payload['user_id'],
@@ -700,36 +980,36 @@ def verify_token():
                     'role': payload['role']
                 },
                 'expires_at': payload['exp']
-            }), 200
+            }, 200)
         else:
-            return jsonify({
+            return json_response({
                 'valid': False,
                 'message': 'Invalid or expired token'
-            }), 401
+            }, 401)
             
     except Exception as e:
         logger.error(f"Token verification error: {e}")
-        return jsonify({
+        return json_response({
             'valid': False,
             'message': 'Token verification failed'
-        }), 500
+        }, 500)
 
 @app.route('/api/captcha', methods=['GET'])
 def get_captcha():
     """Generate a new CAPTCHA challenge"""
     try:
         captcha = auth_service.generate_captcha()
-        return jsonify({
+        return json_response({
             'success': True,
             'captcha': captcha
-        }), 200
+        }, 200)
     except Exception as e:
         logger.error(f"CAPTCHA generation error: {e}")
-        return jsonify({
+        return json_response({
             'success': False,
             'message': 'Failed to generate CAPTCHA'
-        }), 500
+        }, 500)
 
 if __name__ == '__main__':
     logger.info("Starting Mobile Auth Mock API Server")
-    app.run(host='0.0.0.0', port=8081, debug=False)
\ No newline at end of file
+    WSGIServer(('0.0.0.0', 8081), app).serve_forever()
\ No newline at end of file
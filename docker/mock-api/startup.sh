@@ -18,4 +18,4 @@ echo "Redis is ready!"
 
 # Start the Flask application with Gunicorn
 echo "Starting Mock API Server..."
-exec gunicorn --bind 0.0.0.0:8081 --workers 4 --timeout 120 --access-logfile - --error-logfile - app:app
\ No newline at end of file
+exec gunicorn --bind 0.0.0.0:8081 --workers 4 --worker-class gevent --timeout 120 --access-logfile - --error-logfile - app:app
\ No newline at end of file